@@ -20,7 +20,9 @@ async def health_check(request: Request):
 async def detailed_health_check(request: Request):
     """Detailed health check with model and GPU status"""
     model_loaded = hasattr(request.app.state, 'model_manager') and \
-                   request.app.state.model_manager.model is not None
+                   request.app.state.model_manager.is_loaded
+    replicas = request.app.state.model_manager.replicas if model_loaded else None
+    dead_replicas = replicas.dead_replicas if replicas is not None else []
     
     gpu_available = torch.cuda.is_available()
     gpu_count = torch.cuda.device_count() if gpu_available else 0
@@ -28,20 +30,33 @@ async def detailed_health_check(request: Request):
     gpu_info = []
     if gpu_available:
         for i in range(gpu_count):
-            gpu_info.append({
-                "id": i,
-                "name": torch.cuda.get_device_name(i),
-                "memory_allocated_gb": round(torch.cuda.memory_allocated(i) / 1e9, 2),
-                "memory_reserved_gb": round(torch.cuda.memory_reserved(i) / 1e9, 2),
-            })
+            device = {"id": i, "name": torch.cuda.get_device_name(i)}
+            # Replica processes own the GPUs in data-parallel mode; this process's
+            # allocator stats would all read zero, so they are left out
+            if replicas is None:
+                device.update({
+                    "memory_allocated_gb": round(torch.cuda.memory_allocated(i) / 1e9, 2),
+                    "memory_reserved_gb": round(torch.cuda.memory_reserved(i) / 1e9, 2),
+                    "max_memory_allocated_gb": round(torch.cuda.max_memory_allocated(i) / 1e9, 2),
+                    "max_memory_reserved_gb": round(torch.cuda.max_memory_reserved(i) / 1e9, 2),
+                })
+            gpu_info.append(device)
     
     return {
-        "status": "healthy" if model_loaded else "degraded",
+        "status": "healthy" if model_loaded and not dead_replicas else "degraded",
         "model": {
             "loaded": model_loaded,
             "backend": request.app.state.model_manager.backend if model_loaded else None,
             "path": request.app.state.model_manager.model_path if model_loaded else None,
         },
+        "inference": {
+            "replicas": replicas.num_replicas if replicas is not None else None,
+            "dead_replicas": dead_replicas,
+            "in_flight": request.app.state.model_manager.in_flight if model_loaded else 0,
+            # Each replica applies its own admission limit, so the parent's value doesn't apply
+            "max_concurrent": request.app.state.model_manager.max_concurrent
+            if model_loaded and replicas is None else None,
+        },
         "gpu": {
             "available": gpu_available,
             "count": gpu_count,
@@ -2,21 +2,86 @@
 Inference endpoints for video + prompt processing
 """
 import os
+import uuid
+import asyncio
 import logging
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Any, AsyncIterator, Tuple, BinaryIO
 from pathlib import Path
-import aiofiles
 
-from fastapi import APIRouter, Request, HTTPException, UploadFile, File, Form
+import orjson
+from fastapi import APIRouter, Request, HTTPException, UploadFile, File, Form, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
+from starlette.background import BackgroundTask
 
 from app.core.config import settings
+from app.core.video import fetch_video_to_file, VideoTooLargeError
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def upload_params(
+    fps: Optional[float] = Form(default=settings.DEFAULT_VIDEO_FPS),
+    max_frames: Optional[int] = Form(default=settings.DEFAULT_MAX_FRAMES),
+    min_pixels: Optional[int] = Form(default=settings.DEFAULT_MIN_PIXELS),
+    max_pixels: Optional[int] = Form(default=settings.DEFAULT_MAX_PIXELS),
+    total_pixels: Optional[int] = Form(default=settings.DEFAULT_TOTAL_PIXELS),
+    max_tokens: Optional[int] = Form(default=settings.MAX_NEW_TOKENS),
+    temperature: Optional[float] = Form(default=settings.TEMPERATURE),
+    top_p: Optional[float] = Form(default=settings.TOP_P),
+    top_k: Optional[int] = Form(default=settings.TOP_K),
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Collect video and generation parameters from multipart form fields"""
+    video_params = {
+        "fps": fps,
+        "max_frames": max_frames,
+        "min_pixels": min_pixels,
+        "max_pixels": max_pixels,
+        "total_pixels": total_pixels,
+    }
+    
+    generation_params = {
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "top_k": top_k,
+    }
+    
+    return video_params, generation_params
+
+
+def _drain_to_path(src: BinaryIO, path: str, max_bytes: int) -> int:
+    """
+    Copy an upload's spooled file to `path`, failing as soon as it exceeds `max_bytes`
+    
+    Runs as one blocking call on a worker thread: by the time the endpoint runs the
+    multipart body is already spooled, so plain os.write calls are cheaper than a
+    thread-pool hop per chunk.
+    
+    The copy has to be a real file: the video decoders seek (MP4/MOV indexes can sit
+    at the end), so they cannot read from a FIFO. They also open the path with their
+    own descriptor, so readahead hints issued on this one would not affect their reads.
+    """
+    bytes_written = 0
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        while chunk := src.read(settings.UPLOAD_CHUNK_SIZE):
+            bytes_written += len(chunk)
+            if bytes_written > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Video file too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
+                )
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return bytes_written
+
+
 class VideoProcessingParams(BaseModel):
     """Video processing parameters"""
     fps: Optional[float] = Field(default=settings.DEFAULT_VIDEO_FPS, description="Frames per second to sample")
@@ -57,7 +122,8 @@ class InferenceResponse(BaseModel):
     backend: str = Field(..., description="Inference backend used")
 
 
-@router.post("/inference/url", response_model=InferenceResponse)
+# Responses skip response_model validation on the hot path; the model still documents the schema
+@router.post("/inference/url", responses={200: {"model": InferenceResponse}})
 async def inference_from_url(
     request: Request,
     inference_request: InferenceRequestURL
@@ -65,61 +131,75 @@ async def inference_from_url(
     """
     Process a video from URL with text prompt
     
-    The video will be streamed and processed directly without saving to disk.
-    Supports http:// and https:// URLs.
+    Supports http:// and https:// URLs. With URL_PREFETCH enabled the video is
+    downloaded to a temporary file with parallel range requests, processed, then
+    deleted; otherwise the decoder reads the URL directly.
     """
     model_manager = request.app.state.model_manager
+    logger.info(f"Processing video from URL: {inference_request.video_url}")
+    
+    temp_video_path = await _prefetch_url(inference_request.video_url)
     
     try:
-        logger.info(f"Processing video from URL: {inference_request.video_url}")
-        
         # Convert Pydantic models to dicts
         video_params = inference_request.video_params.model_dump() if inference_request.video_params else None
         generation_params = inference_request.generation_params.model_dump() if inference_request.generation_params else None
         
         # Generate response
         response_text = await model_manager.generate(
-            video=inference_request.video_url,
+            video=f"file://{temp_video_path}" if temp_video_path else inference_request.video_url,
             prompt=inference_request.prompt,
             video_params=video_params,
             generation_params=generation_params
         )
         
-        return InferenceResponse(
-            response=response_text,
-            prompt=inference_request.prompt,
-            video_source=inference_request.video_url,
-            backend=model_manager.backend
-        )
+        return ORJSONResponse({
+            "response": response_text,
+            "prompt": inference_request.prompt,
+            "video_source": inference_request.video_url,
+            "backend": model_manager.backend,
+        })
     
     except Exception as e:
         logger.error(f"Inference failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+    
+    finally:
+        if temp_video_path is not None:
+            _remove_temp_file(temp_video_path)
 
 
-@router.post("/inference/upload", response_model=InferenceResponse)
-async def inference_from_upload(
-    request: Request,
-    video: UploadFile = File(...),
-    prompt: str = Form(...),
-    fps: Optional[float] = Form(default=settings.DEFAULT_VIDEO_FPS),
-    max_frames: Optional[int] = Form(default=settings.DEFAULT_MAX_FRAMES),
-    min_pixels: Optional[int] = Form(default=settings.DEFAULT_MIN_PIXELS),
-    max_pixels: Optional[int] = Form(default=settings.DEFAULT_MAX_PIXELS),
-    total_pixels: Optional[int] = Form(default=settings.DEFAULT_TOTAL_PIXELS),
-    max_tokens: Optional[int] = Form(default=settings.MAX_NEW_TOKENS),
-    temperature: Optional[float] = Form(default=settings.TEMPERATURE),
-    top_p: Optional[float] = Form(default=settings.TOP_P),
-    top_k: Optional[int] = Form(default=settings.TOP_K),
-):
-    """
-    Process an uploaded video file with text prompt
+async def _prefetch_url(video_url: str) -> Optional[str]:
+    """Download a video URL to a temp file when URL_PREFETCH is enabled, else return None"""
+    if not settings.URL_PREFETCH:
+        return None
     
-    Accepts multipart/form-data with video file and parameters.
-    The video will be temporarily saved, processed, then deleted.
+    try:
+        return await fetch_video_to_file(video_url)
+    except VideoTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to fetch video: {e}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Failed to fetch video: {str(e)}")
+
+
+def _remove_temp_file(path: str) -> None:
+    """Remove a temporary upload, logging rather than raising on failure"""
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+            logger.info(f"Cleaned up temporary file: {path}")
+        except Exception as e:
+            logger.warning(f"Failed to cleanup temp file: {e}")
+
+
+async def _save_upload(video: UploadFile) -> str:
     """
-    model_manager = request.app.state.model_manager
+    Validate and copy an uploaded video to a temporary file
     
+    Returns the path of the saved file. The caller owns the file and must
+    remove it with _remove_temp_file once inference is finished.
+    """
     # Validate file extension
     file_ext = Path(video.filename).suffix.lower()
     if file_ext not in settings.ALLOWED_VIDEO_FORMATS:
@@ -128,47 +208,115 @@ async def inference_from_upload(
             detail=f"Invalid video format. Allowed formats: {settings.ALLOWED_VIDEO_FORMATS}"
         )
     
-    # Check file size
-    video.file.seek(0, 2)  # Seek to end
-    file_size = video.file.tell()
-    video.file.seek(0)  # Reset to start
+    # Unique name so concurrent uploads of the same filename don't clobber each other
+    temp_video_path = os.path.join(
+        settings.UPLOAD_DIR,
+        f"temp_{os.getpid()}_{uuid.uuid4().hex}{file_ext}"
+    )
     
-    if file_size > settings.MAX_VIDEO_SIZE_MB * 1024 * 1024:
+    # The multipart body is fully spooled before the endpoint runs, so reject oversized
+    # uploads from their known size instead of copying them to disk first
+    max_bytes = settings.MAX_VIDEO_SIZE_MB * 1024 * 1024
+    if video.size is not None and video.size > max_bytes:
         raise HTTPException(
-            status_code=400,
+            status_code=413,
             detail=f"Video file too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
         )
     
-    # Save uploaded file temporarily
-    temp_video_path = os.path.join(
-        settings.UPLOAD_DIR,
-        f"temp_{os.getpid()}_{video.filename}"
+    try:
+        # Copy to disk in fixed-size chunks; the limit is re-checked as a backstop for unknown sizes
+        await video.seek(0)
+        bytes_written = await asyncio.to_thread(_drain_to_path, video.file, temp_video_path, max_bytes)
+    except BaseException:
+        _remove_temp_file(temp_video_path)
+        raise
+    
+    logger.info(f"Saved uploaded video ({bytes_written} bytes) to: {temp_video_path}")
+    return temp_video_path
+
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format a server-sent event. Payloads are JSON so tokens containing newlines stay intact"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+
+async def _stream_tokens(
+    model_manager,
+    video: str,
+    prompt: str,
+    video_params: Optional[Dict[str, Any]],
+    generation_params: Optional[Dict[str, Any]]
+) -> AsyncIterator[str]:
+    """Yield generated text as SSE events"""
+    try:
+        async for token in model_manager.generate_stream(
+            video=video,
+            prompt=prompt,
+            video_params=video_params,
+            generation_params=generation_params
+        ):
+            yield _sse_event({"token": token})
+        yield _sse_event({"backend": model_manager.backend}, event="done")
+    
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Streaming inference failed: {e}", exc_info=True)
+        yield _sse_event({"detail": f"Inference failed: {str(e)}"}, event="error")
+
+
+@router.post("/inference/url/stream")
+async def inference_from_url_stream(
+    request: Request,
+    inference_request: InferenceRequestURL
+):
+    """
+    Process a video from URL with text prompt, streaming tokens as they are generated
+    
+    Returns a text/event-stream of `data: {"token": ...}` events, followed by a
+    `done` event (or an `error` event if generation fails mid-stream).
+    """
+    model_manager = request.app.state.model_manager
+    logger.info(f"Streaming video from URL: {inference_request.video_url}")
+    
+    video_params = inference_request.video_params.model_dump() if inference_request.video_params else None
+    generation_params = inference_request.generation_params.model_dump() if inference_request.generation_params else None
+    
+    temp_video_path = await _prefetch_url(inference_request.video_url)
+    
+    return StreamingResponse(
+        _stream_tokens(
+            model_manager,
+            video=f"file://{temp_video_path}" if temp_video_path else inference_request.video_url,
+            prompt=inference_request.prompt,
+            video_params=video_params,
+            generation_params=generation_params
+        ),
+        media_type="text/event-stream",
+        # Runs after the response even if the client disconnects before the stream starts
+        background=BackgroundTask(_remove_temp_file, temp_video_path) if temp_video_path else None
     )
+
+
+@router.post("/inference/upload", responses={200: {"model": InferenceResponse}})
+async def inference_from_upload(
+    request: Request,
+    video: UploadFile = File(...),
+    prompt: str = Form(...),
+    params: Tuple[Dict[str, Any], Dict[str, Any]] = Depends(upload_params),
+):
+    """
+    Process an uploaded video file with text prompt
+    
+    Accepts multipart/form-data with video file and parameters.
+    The video will be temporarily saved, processed, then deleted.
+    """
+    model_manager = request.app.state.model_manager
+    video_params, generation_params = params
+    
+    temp_video_path = await _save_upload(video)
     
     try:
-        # Save file
-        async with aiofiles.open(temp_video_path, 'wb') as out_file:
-            content = await video.read()
-            await out_file.write(content)
-        
-        logger.info(f"Saved uploaded video to: {temp_video_path}")
-        
-        # Prepare parameters
-        video_params = {
-            "fps": fps,
-            "max_frames": max_frames,
-            "min_pixels": min_pixels,
-            "max_pixels": max_pixels,
-            "total_pixels": total_pixels,
-        }
-        
-        generation_params = {
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "top_p": top_p,
-            "top_k": top_k,
-        }
-        
         # Generate response
         response_text = await model_manager.generate(
             video=f"file://{temp_video_path}",
@@ -177,12 +325,12 @@ async def inference_from_upload(
             generation_params=generation_params
         )
         
-        return InferenceResponse(
-            response=response_text,
-            prompt=prompt,
-            video_source=video.filename,
-            backend=model_manager.backend
-        )
+        return ORJSONResponse({
+            "response": response_text,
+            "prompt": prompt,
+            "video_source": video.filename,
+            "backend": model_manager.backend,
+        })
     
     except Exception as e:
         logger.error(f"Inference failed: {e}", exc_info=True)
@@ -190,10 +338,36 @@ async def inference_from_upload(
     
     finally:
         # Cleanup temporary file
-        if os.path.exists(temp_video_path):
-            try:
-                os.remove(temp_video_path)
-                logger.info(f"Cleaned up temporary file: {temp_video_path}")
-            except Exception as e:
-                logger.warning(f"Failed to cleanup temp file: {e}")
+        _remove_temp_file(temp_video_path)
+
 
+@router.post("/inference/upload/stream")
+async def inference_from_upload_stream(
+    request: Request,
+    video: UploadFile = File(...),
+    prompt: str = Form(...),
+    params: Tuple[Dict[str, Any], Dict[str, Any]] = Depends(upload_params),
+):
+    """
+    Process an uploaded video file with text prompt, streaming tokens as they are generated
+    
+    Same form fields as /inference/upload; the response is the same event stream
+    as /inference/url/stream. The temporary file is deleted when the stream ends.
+    """
+    model_manager = request.app.state.model_manager
+    video_params, generation_params = params
+    
+    temp_video_path = await _save_upload(video)
+    
+    return StreamingResponse(
+        _stream_tokens(
+            model_manager,
+            video=f"file://{temp_video_path}",
+            prompt=prompt,
+            video_params=video_params,
+            generation_params=generation_params
+        ),
+        media_type="text/event-stream",
+        # Runs after the response even if the client disconnects before the stream starts
+        background=BackgroundTask(_remove_temp_file, temp_video_path)
+    )
@@ -3,6 +3,7 @@ Configuration management for the VLM inference service
 """
 import os
 import json
+import importlib.util
 from typing import List
 from pydantic_settings import BaseSettings
 
@@ -17,13 +18,25 @@ class Settings(BaseSettings):
     
     # Model configuration
     MODEL_PATH: str = os.getenv("MODEL_PATH", "Qwen/Qwen3-VL-8B-Instruct")
-    MODEL_BACKEND: str = os.getenv("MODEL_BACKEND", "hf")  # "vllm" or "hf"
+    # "vllm" or "hf". Defaults to vLLM whenever it is installed, otherwise HF
+    MODEL_BACKEND: str = os.getenv(
+        "MODEL_BACKEND",
+        "vllm" if importlib.util.find_spec("vllm") is not None else "hf"
+    )
     DEVICE_MAP: str = "auto"
     USE_FLASH_ATTN: bool = True
+    QUANTIZATION: str = "none"  # HF weight quantization: "none", "int8", "nf4" (bitsandbytes) or "fp8" (torchao)
+    HF_COMPILE: bool = False  # torch.compile the HF decode step with a static KV cache
+    HF_DATA_PARALLEL: bool = False  # On multi-GPU hosts, run one full HF model replica process per GPU
+    HF_WARMUP: bool = True  # Run a dummy generate at startup to pre-warm kernels and the CUDA allocator
+    HF_CUDA_ALLOC_CONF: str = "expandable_segments:True,max_split_size_mb:512,garbage_collection_threshold:0.8"
     
     # vLLM specific settings
     VLLM_GPU_MEMORY_UTILIZATION: float = 0.85
     VLLM_TENSOR_PARALLEL_SIZE: int = int(os.getenv("VLLM_TENSOR_PARALLEL_SIZE", "1"))
+    VLLM_MAX_NUM_SEQS: int = 32  # Max sequences scheduled per engine step
+    VLLM_MAX_MODEL_LEN: int = 0  # Context length cap (0 = model default)
+    VLLM_ENABLE_PREFIX_CACHING: bool = True  # Reuse KV cache for shared prompt prefixes
     
     # Video processing settings
     DEFAULT_VIDEO_FPS: float = 2.0
@@ -32,6 +45,7 @@ class Settings(BaseSettings):
     DEFAULT_MAX_PIXELS: int = 256 * 32 * 32
     DEFAULT_TOTAL_PIXELS: int = 20480 * 32 * 32
     IMAGE_PATCH_SIZE: int = 16  # 16 for Qwen3-VL, 14 for Qwen2.5-VL
+    VIDEO_DECODE_DEVICE: str = "cpu"  # "cpu" or "cuda" (NVDEC via torchcodec, HF backend only)
     
     # Generation settings
     MAX_NEW_TOKENS: int = 2048
@@ -39,10 +53,24 @@ class Settings(BaseSettings):
     TOP_P: float = 0.8
     TOP_K: int = 20
     
+    # Concurrency settings
+    INFERENCE_THREAD_WORKERS: int = 0  # Threads for blocking decode/preprocess work (0 = CPU count); generate runs on its own thread
+    MAX_CONCURRENT_INFERENCE: int = 0  # Concurrent requests admitted to the model (0 = backend default: hf=HF_BATCH_SIZE, vllm=VLLM_MAX_NUM_SEQS)
+    HF_BATCH_SIZE: int = 1  # Max requests coalesced into one HF generate call (1 = no batching)
+    HF_BATCH_WINDOW_MS: int = 50  # How long to wait for more requests before running a batch
+    CHAT_TEMPLATE_CACHE_SIZE: int = 256  # Rendered chat templates kept for repeated prompts
+    
+    # GPU memory watchdog
+    VRAM_WATCHDOG_INTERVAL_S: float = 30.0  # Seconds between idle checks (0 = disabled)
+    EMPTY_CACHE_THRESHOLD_GB: float = 2.0  # Empty the cache when reserved exceeds max(allocated, post-warmup reserved) by this
+    
     # API settings
     MAX_VIDEO_SIZE_MB: int = 1000  # 1GB max
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MiB read/write chunks when streaming uploads
     ALLOWED_VIDEO_FORMATS: List[str] = [".mp4", ".avi", ".mkv", ".mov", ".webm"]
     UPLOAD_DIR: str = "/tmp/tru-v2-uploads"
+    URL_PREFETCH: bool = True  # Download video URLs locally before decoding
+    URL_FETCH_SHARDS: int = 4  # Concurrent HTTP range requests per URL download
     
     # CORS - Parse from environment or use defaults
     CORS_ORIGINS: List[str] = json.loads(
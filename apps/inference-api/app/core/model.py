@@ -3,25 +3,74 @@ Model loading and inference management
 Extracted and adapted from Qwen3-VL web_demo_mm.py
 """
 import os
+import uuid
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any, Union
-
-import torch
-from transformers import AutoProcessor, AutoModelForImageTextToText
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Union, Tuple, AsyncIterator
 
 from app.core.config import settings
+from app.core.replicas import ReplicaPool
+
+# Allocator settings must be in place before the first CUDA allocation. vLLM manages
+# its own memory pool, so only apply them to the HF backend.
+if settings.MODEL_BACKEND == "hf":
+    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", settings.HF_CUDA_ALLOC_CONF)
+
+import torch
+from PIL import Image
+from transformers import (
+    AutoProcessor,
+    AutoModelForImageTextToText,
+    AsyncTextIteratorStreamer,
+    CompileConfig,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
+from transformers.generation.streamers import BaseStreamer
 
 logger = logging.getLogger(__name__)
 
 # Check if vLLM is available
 try:
-    from vllm import LLM, SamplingParams
+    from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
     from qwen_vl_utils import process_vision_info
     VLLM_AVAILABLE = True
 except ImportError:
     VLLM_AVAILABLE = False
     logger.warning("vLLM not available. Using HuggingFace backend only.")
 
+# Defaults resolved once at import so each request does a single dict merge
+_DEFAULT_VIDEO_PARAMS = MappingProxyType({
+    "min_pixels": settings.DEFAULT_MIN_PIXELS,
+    "max_pixels": settings.DEFAULT_MAX_PIXELS,
+    "total_pixels": settings.DEFAULT_TOTAL_PIXELS,
+    "fps": settings.DEFAULT_VIDEO_FPS,
+    "max_frames": settings.DEFAULT_MAX_FRAMES,
+})
+
+_DEFAULT_GENERATION_PARAMS = MappingProxyType({
+    "max_tokens": settings.MAX_NEW_TOKENS,
+    "temperature": settings.TEMPERATURE,
+    "top_p": settings.TOP_P,
+    "top_k": settings.TOP_K,
+})
+
+
+class _CancelCriteria(StoppingCriteria):
+    """Stops an HF generate call once `event` is set, e.g. when a streaming client disconnects"""
+    
+    def __init__(self, event: threading.Event):
+        self.event = event
+    
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
 
 class ModelManager:
     """Manages model loading, configuration, and inference"""
@@ -32,10 +81,29 @@ class ModelManager:
         self.backend = settings.MODEL_BACKEND
         self.model_path = settings.MODEL_PATH
         
+        # Dedicated pool for blocking decode/preprocess work so the event loop stays responsive
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.INFERENCE_THREAD_WORKERS or os.cpu_count(),
+            thread_name_prefix="inference"
+        )
+        # Blocking model calls get a single thread of their own: model.generate is not safe to
+        # run concurrently, and decode work queued on the pool above can never starve it
+        self._gpu_thread: Optional[threading.Thread] = None
+        self._gpu_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="inference-gpu",
+            initializer=self._bind_gpu_thread
+        )
+        
         # Validate backend choice
         if self.backend not in ["vllm", "hf"]:
             raise ValueError(f"Invalid MODEL_BACKEND: {self.backend}. Must be 'vllm' or 'hf'")
         
+        if settings.QUANTIZATION not in ["none", "int8", "nf4", "fp8"]:
+            raise ValueError(
+                f"Invalid QUANTIZATION: {settings.QUANTIZATION}. Must be 'none', 'int8', 'nf4' or 'fp8'"
+            )
+        
         if self.backend == "vllm" and not VLLM_AVAILABLE:
             error_msg = (
                 "vLLM backend requested but not available. "
@@ -44,12 +112,50 @@ class ModelManager:
             )
             logger.error(error_msg)
             raise RuntimeError(error_msg)
+        
+        # Admission control for the GPU stage: decoded requests queue here instead of racing for VRAM.
+        # Video decode and preprocessing happen before it, so they overlap with running generates.
+        self.max_concurrent = settings.MAX_CONCURRENT_INFERENCE
+        if self.max_concurrent <= 0:
+            # vLLM batches internally; the HF backend admits one micro-batch worth of requests
+            if self.backend == "vllm":
+                self.max_concurrent = settings.VLLM_MAX_NUM_SEQS
+            else:
+                self.max_concurrent = max(settings.HF_BATCH_SIZE, 1)
+        self._gpu_sem = asyncio.Semaphore(self.max_concurrent)
+        self.in_flight = 0
+        self._warned_hf_contention = False
+        # Reserved VRAM per device after warmup; the idle watchdog leaves this much cached
+        self.warm_reserved: Dict[int, int] = {}
+        
+        # HF micro-batching (started in load_model when HF_BATCH_SIZE > 1)
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        
+        # One HF model replica process per GPU (started in load_model when HF_DATA_PARALLEL is set)
+        self.replicas: Optional[ReplicaPool] = None
+    
+    def _bind_gpu_thread(self):
+        """Record the GPU executor's thread (runs once, as that thread starts)"""
+        self._gpu_thread = threading.current_thread()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Whether requests can be served, either locally or by replica processes"""
+        return self.replicas is not None or (self.model is not None and self.processor is not None)
     
     async def load_model(self):
         """Load the model based on configured backend"""
         logger.info(f"Loading model from: {self.model_path}")
         logger.info(f"Using backend: {self.backend}")
         
+        if self.backend == "hf" and settings.HF_DATA_PARALLEL and torch.cuda.device_count() > 1:
+            # Each replica process loads its own model, processor, warmup and batching
+            logger.info(f"Starting {torch.cuda.device_count()} data-parallel HF replicas")
+            self.replicas = ReplicaPool(torch.cuda.device_count())
+            await self.replicas.start()
+            return
+        
         if self.backend == "vllm":
             self._load_vllm_model()
         else:
@@ -57,7 +163,25 @@ class ModelManager:
         
         # Load processor (needed for both backends)
         self.processor = AutoProcessor.from_pretrained(self.model_path)
+        self._render_chat_template = lru_cache(maxsize=settings.CHAT_TEMPLATE_CACHE_SIZE)(
+            self._render_chat_template_uncached
+        )
         logger.info("Processor loaded successfully")
+        
+        if self.backend == "hf" and settings.HF_BATCH_SIZE > 1:
+            # Decoder-only generation needs left padding when prompts are batched
+            self.processor.tokenizer.padding_side = "left"
+        
+        if self.backend == "hf" and settings.HF_WARMUP:
+            await self._warmup_hf()
+        
+        if self.backend == "hf" and settings.HF_BATCH_SIZE > 1:
+            self._batch_queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._hf_batch_worker())
+            logger.info(
+                f"HF micro-batching enabled: batch_size={settings.HF_BATCH_SIZE}, "
+                f"window={settings.HF_BATCH_WINDOW_MS}ms"
+            )
     
     def _load_vllm_model(self):
         """Load model using vLLM backend for optimized inference"""
@@ -69,18 +193,28 @@ class ModelManager:
         
         logger.info(f"Initializing vLLM with tensor_parallel_size={tensor_parallel_size}")
         
-        self.model = LLM(
+        # The async engine schedules all in-flight requests together (continuous batching)
+        engine_args = AsyncEngineArgs(
             model=self.model_path,
             trust_remote_code=True,
             gpu_memory_utilization=settings.VLLM_GPU_MEMORY_UTILIZATION,
             enforce_eager=False,
             tensor_parallel_size=tensor_parallel_size,
+            max_num_seqs=settings.VLLM_MAX_NUM_SEQS,
+            max_model_len=settings.VLLM_MAX_MODEL_LEN or None,
+            enable_prefix_caching=settings.VLLM_ENABLE_PREFIX_CACHING,
+            enable_chunked_prefill=True,
             seed=42
         )
+        self.model = AsyncLLMEngine.from_engine_args(engine_args)
         logger.info("vLLM model loaded successfully")
     
     def _load_hf_model(self):
         """Load model using HuggingFace Transformers backend"""
+        # TF32 for any fp32 matmuls/convs left in the graph (no effect on bf16/fp16 weights)
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        
         load_kwargs = {
             "device_map": settings.DEVICE_MAP,
             "torch_dtype": "auto",
@@ -90,11 +224,115 @@ class ModelManager:
             load_kwargs["attn_implementation"] = "flash_attention_2"
             logger.info("Using flash_attention_2")
         
+        # Vision tower stays in full precision: quantizing its small convs costs more accuracy than it saves
+        if settings.QUANTIZATION in ("int8", "nf4"):
+            from transformers import BitsAndBytesConfig
+            
+            if settings.QUANTIZATION == "int8":
+                load_kwargs["quantization_config"] = BitsAndBytesConfig(
+                    load_in_8bit=True,
+                    llm_int8_skip_modules=["visual", "lm_head"]
+                )
+            else:
+                load_kwargs["quantization_config"] = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.bfloat16,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_use_double_quant=True,
+                    llm_int8_skip_modules=["visual", "lm_head"]
+                )
+            logger.info(f"Quantizing language model weights with bitsandbytes ({settings.QUANTIZATION})")
+        
         self.model = AutoModelForImageTextToText.from_pretrained(
             self.model_path,
             **load_kwargs
         )
+        
+        if settings.QUANTIZATION == "fp8":
+            from torchao.quantization import quantize_, Float8WeightOnlyConfig
+            
+            quantize_(
+                self.model,
+                Float8WeightOnlyConfig(),
+                filter_fn=lambda module, fqn: isinstance(module, torch.nn.Linear)
+                and "visual" not in fqn
+                and "lm_head" not in fqn
+            )
+            logger.info("Quantized language model weights to FP8 with torchao")
+        
+        # Inference only: no dropout, no autograd bookkeeping for the weights
+        self.model.eval()
+        self.model.requires_grad_(False)
+        
         logger.info("HuggingFace model loaded successfully")
+        
+        if settings.VIDEO_DECODE_DEVICE != "cpu":
+            from qwen_vl_utils.vision_process import get_video_reader_backend
+            
+            reader = get_video_reader_backend()
+            if reader != "torchcodec":
+                logger.warning(
+                    f"VIDEO_DECODE_DEVICE={settings.VIDEO_DECODE_DEVICE} only applies to the torchcodec "
+                    f"video reader, but qwen-vl-utils is using {reader}; videos will be decoded on the CPU. "
+                    "Unset FORCE_QWENVL_VIDEO_READER or set it to torchcodec."
+                )
+        
+        if settings.HF_COMPILE:
+            # With a static KV cache, generate compiles only the decode step (compile_config) and
+            # runs prefill eagerly, so vision inputs of every geometry don't each trigger a recompile.
+            # The model holds a single cache that every generate call resets, and inductor's CUDA
+            # graph trees are per-thread, so compiled generates must all run on the GPU thread.
+            self.model.generation_config.cache_implementation = "static"
+            self.model.generation_config.compile_config = CompileConfig(fullgraph=False, mode="reduce-overhead")
+            if not getattr(self.model, "_can_compile_fullgraph", False):
+                logger.warning("HF_COMPILE is set but this model does not support compiled decoding; running eagerly")
+            else:
+                logger.info("Compiling the HF decode step with torch.compile (static KV cache)")
+    
+    async def _warmup_hf(self):
+        """
+        Run one throwaway generate sized to the default video budget
+        
+        Covers CUDA context setup, kernel selection and compilation, and grows the
+        allocator to roughly what a full-budget request needs. Frame count follows
+        qwen_vl_utils: per-frame pixels are capped at total_pixels / nframes * 2, so
+        the largest input is the most frames that still fit at DEFAULT_MAX_PIXELS.
+        
+        The warmed segments are kept: the reserved total is recorded in
+        warm_reserved, and the VRAM watchdog only empties the cache once it grows
+        past that by more than EMPTY_CACHE_THRESHOLD_GB.
+        
+        A failure here (typically OOM on a GPU too small for the full budget) is
+        logged and the service starts cold, since smaller requests may still fit.
+        """
+        side = int(settings.DEFAULT_MAX_PIXELS ** 0.5)
+        num_frames = min(
+            settings.DEFAULT_MAX_FRAMES,
+            2 * settings.DEFAULT_TOTAL_PIXELS // settings.DEFAULT_MAX_PIXELS
+        )
+        num_frames = max(2, num_frames - num_frames % 2)
+        logger.info(f"Warming up HuggingFace model with {num_frames} {side}x{side} frames...")
+        
+        frames = [Image.new("RGB", (side, side)) for _ in range(num_frames)]
+        messages = self._prepare_messages(frames, "Describe the video.")
+        
+        try:
+            prepared = await self._run_blocking(self._prepare_hf_inputs, messages)
+            await self._run_on_gpu(self._generate_hf_batch, [prepared], 8, 0.0, 1.0, 0)
+        except Exception as e:
+            logger.warning(f"Warmup failed, starting without it: {e}")
+        else:
+            if torch.cuda.is_available():
+                self.warm_reserved = {
+                    i: torch.cuda.memory_reserved(i) for i in range(torch.cuda.device_count())
+                }
+            logger.info("Warmup complete")
+            return
+        
+        # Outside the except block so the traceback no longer pins the failed attempt's tensors
+        prepared = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
     
     def _prepare_messages(
         self,
@@ -103,22 +341,16 @@ class ModelManager:
         video_params: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Prepare messages in Qwen3-VL format"""
-        if video_params is None:
-            video_params = {}
-        
         # Set defaults
-        video_config = {
-            "video": video,
-            "min_pixels": video_params.get("min_pixels", settings.DEFAULT_MIN_PIXELS),
-            "max_pixels": video_params.get("max_pixels", settings.DEFAULT_MAX_PIXELS),
-            "total_pixels": video_params.get("total_pixels", settings.DEFAULT_TOTAL_PIXELS),
-            "fps": video_params.get("fps", settings.DEFAULT_VIDEO_FPS),
-            "max_frames": video_params.get("max_frames", settings.DEFAULT_MAX_FRAMES),
-        }
+        video_config = {**_DEFAULT_VIDEO_PARAMS, **(video_params or {}), "video": video}
         
         # Handle pre-sampled frames
         if isinstance(video, list):
-            video_config["sample_fps"] = video_params.get("sample_fps", settings.DEFAULT_VIDEO_FPS)
+            video_config.setdefault("sample_fps", settings.DEFAULT_VIDEO_FPS)
+        elif self.backend == "hf" and settings.VIDEO_DECODE_DEVICE != "cpu":
+            # NVDEC decode lands frames directly in GPU memory. vLLM preprocesses
+            # in its engine process, so its frames stay on the CPU.
+            video_config["decode_device"] = settings.VIDEO_DECODE_DEVICE
         
         messages = [
             {
@@ -132,13 +364,49 @@ class ModelManager:
         
         return messages
     
-    def _prepare_vllm_inputs(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Prepare inputs for vLLM inference"""
-        text = self.processor.apply_chat_template(
-            messages, 
-            tokenize=False, 
+    def _apply_chat_template(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        Render the chat template, reusing the result for repeated prompts
+        
+        The rendered text only depends on roles, text and where vision inputs sit
+        (each becomes a placeholder that the processor expands later), so the cache
+        key drops the video/image payloads and their sampling parameters.
+        """
+        key = tuple(
+            (
+                message["role"],
+                tuple(
+                    ("text", ele["text"]) if ele.get("type") == "text"
+                    else ("image", None) if "image" in ele or "image_url" in ele or ele.get("type") in ("image", "image_url")
+                    else ("video", None)
+                    for ele in message["content"]
+                ) if isinstance(message["content"], list) else message["content"]
+            )
+            for message in messages
+        )
+        return self._render_chat_template(key)
+    
+    def _render_chat_template_uncached(self, key: Tuple) -> str:
+        """Rebuild placeholder messages from a cache key and render them"""
+        messages = [
+            {
+                "role": role,
+                "content": [
+                    {"type": "text", "text": value} if kind == "text" else {"type": kind}
+                    for kind, value in content
+                ] if isinstance(content, tuple) else content
+            }
+            for role, content in key
+        ]
+        return self.processor.apply_chat_template(
+            messages,
+            tokenize=False,
             add_generation_prompt=True
         )
+    
+    def _prepare_vllm_inputs(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Prepare inputs for vLLM inference"""
+        text = self._apply_chat_template(messages)
         
         image_inputs, video_inputs, video_kwargs = process_vision_info(
             messages,
@@ -159,6 +427,20 @@ class ModelManager:
             'mm_processor_kwargs': video_kwargs
         }
     
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking callable on the inference thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+    
+    def _run_on_gpu(self, func, *args, **kwargs) -> asyncio.Future:
+        """
+        Run a blocking model call on the single GPU thread
+        
+        The call is submitted immediately; await the returned future for its result.
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._gpu_executor, partial(func, *args, **kwargs))
+    
     async def generate(
         self,
         video: Union[str, List],
@@ -178,25 +460,95 @@ class ModelManager:
         Returns:
             Generated text response
         """
+        if self.replicas is not None:
+            self.in_flight += 1
+            try:
+                return await self.replicas.generate(
+                    video=video,
+                    prompt=prompt,
+                    video_params=video_params,
+                    generation_params=generation_params
+                )
+            finally:
+                self.in_flight -= 1
+        
+        messages, gen_args = self._prepare_request(video, prompt, video_params, generation_params)
+        
+        # Each backend takes the GPU semaphore itself, once its CPU-side decode is done
+        self.in_flight += 1
+        try:
+            if self.backend == "vllm":
+                return await self._generate_vllm(messages, *gen_args)
+            else:
+                return await self._generate_hf(messages, *gen_args)
+        finally:
+            self.in_flight -= 1
+    
+    async def generate_stream(
+        self,
+        video: Union[str, List],
+        prompt: str,
+        video_params: Optional[Dict[str, Any]] = None,
+        generation_params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate response for video + prompt, yielding text as it is produced
+        
+        Takes the same arguments as generate(). Each yielded string is the text
+        generated since the previous one.
+        """
+        if self.replicas is not None:
+            self.in_flight += 1
+            try:
+                async for text in self.replicas.generate_stream(
+                    video=video,
+                    prompt=prompt,
+                    video_params=video_params,
+                    generation_params=generation_params
+                ):
+                    yield text
+            finally:
+                self.in_flight -= 1
+            return
+        
+        messages, gen_args = self._prepare_request(video, prompt, video_params, generation_params)
+        
+        self.in_flight += 1
+        try:
+            if self.backend == "vllm":
+                stream = self._stream_vllm(messages, *gen_args)
+            else:
+                stream = self._stream_hf(messages, *gen_args)
+            async for text in stream:
+                yield text
+        finally:
+            self.in_flight -= 1
+    
+    def _prepare_request(
+        self,
+        video: Union[str, List],
+        prompt: str,
+        video_params: Optional[Dict[str, Any]],
+        generation_params: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Tuple[int, float, float, int]]:
+        """Build messages and resolve (max_tokens, temperature, top_p, top_k) for a request"""
         if self.model is None or self.processor is None:
             raise RuntimeError("Model not loaded. Call load_model() first.")
         
         # Prepare generation parameters
-        if generation_params is None:
-            generation_params = {}
-        
-        max_tokens = generation_params.get("max_tokens", settings.MAX_NEW_TOKENS)
-        temperature = generation_params.get("temperature", settings.TEMPERATURE)
-        top_p = generation_params.get("top_p", settings.TOP_P)
-        top_k = generation_params.get("top_k", settings.TOP_K)
+        params = {**_DEFAULT_GENERATION_PARAMS, **(generation_params or {})}
         
         # Prepare messages
         messages = self._prepare_messages(video, prompt, video_params)
         
-        if self.backend == "vllm":
-            return await self._generate_vllm(messages, max_tokens, temperature, top_p, top_k)
-        else:
-            return await self._generate_hf(messages, max_tokens, temperature, top_p, top_k)
+        if self.backend == "hf" and self._gpu_sem.locked() and not self._warned_hf_contention:
+            self._warned_hf_contention = True
+            logger.warning(
+                "Requests are queuing behind the HF backend, which serves them one batch at a time. "
+                "Set MODEL_BACKEND=vllm for continuous batching under concurrent traffic."
+            )
+        
+        return messages, (params["max_tokens"], params["temperature"], params["top_p"], params["top_k"])
     
     async def _generate_vllm(
         self,
@@ -207,7 +559,7 @@ class ModelManager:
         top_k: int
     ) -> str:
         """Generate using vLLM backend"""
-        inputs = self._prepare_vllm_inputs(messages)
+        inputs = await self._run_blocking(self._prepare_vllm_inputs, messages)
         
         sampling_params = SamplingParams(
             max_tokens=max_tokens,
@@ -216,30 +568,49 @@ class ModelManager:
             top_k=top_k,
         )
         
-        outputs = self.model.generate([inputs], sampling_params=sampling_params)
+        final_output = None
+        async with self._gpu_sem:
+            async for output in self.model.generate(inputs, sampling_params, request_id=uuid.uuid4().hex):
+                final_output = output
         
-        if outputs and outputs[0].outputs:
-            return outputs[0].outputs[0].text
+        if final_output and final_output.outputs:
+            return final_output.outputs[0].text
         return ""
     
-    async def _generate_hf(
+    async def _stream_vllm(
         self,
         messages: List[Dict[str, Any]],
         max_tokens: int,
         temperature: float,
         top_p: float,
         top_k: int
-    ) -> str:
-        """Generate using HuggingFace backend"""
-        from qwen_vl_utils import process_vision_info
+    ) -> AsyncIterator[str]:
+        """Stream text deltas from the vLLM engine as each step completes"""
+        inputs = await self._run_blocking(self._prepare_vllm_inputs, messages)
         
-        # Process vision inputs
-        text = self.processor.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
+        sampling_params = SamplingParams(
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
         )
         
+        sent = 0
+        async with self._gpu_sem:
+            async for output in self.model.generate(inputs, sampling_params, request_id=uuid.uuid4().hex):
+                if not output.outputs:
+                    continue
+                text = output.outputs[0].text
+                if len(text) > sent:
+                    yield text[sent:]
+                    sent = len(text)
+    
+    def _prepare_hf_inputs(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply the chat template and decode vision inputs for one HF request"""
+        from qwen_vl_utils import process_vision_info
+        
+        text = self._apply_chat_template(messages)
+        
         image_inputs, video_inputs, video_kwargs = process_vision_info(
             messages,
             image_patch_size=settings.IMAGE_PATCH_SIZE,
@@ -255,28 +626,67 @@ class ModelManager:
             videos = None
             video_metadatas = None
         
-        # Prepare inputs
+        return {
+            "text": text,
+            "images": image_inputs,
+            "videos": videos,
+            "video_metadata": video_metadatas,
+            "video_kwargs": video_kwargs,
+        }
+    
+    def _generate_hf_batch(
+        self,
+        requests: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        streamer: Optional[BaseStreamer] = None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None
+    ) -> List[str]:
+        """Run one HF generate call over a batch of prepared requests (on the GPU thread)"""
+        if settings.HF_COMPILE and threading.current_thread() is not self._gpu_thread:
+            # Two generates sharing the static KV cache would silently corrupt each other's output
+            raise RuntimeError("Compiled HF generate called off the GPU thread; submit it with _run_on_gpu")
+        
+        images = [img for r in requests for img in (r["images"] or [])] or None
+        videos = [vid for r in requests for vid in (r["videos"] or [])] or None
+        video_metadatas = [meta for r in requests for meta in (r["video_metadata"] or [])] or None
+        
+        device = self.model.device
+        pin = device.type == "cuda"
+        
+        # Prepare inputs (left padding keeps every prompt flush against its generated tokens)
         inputs = self.processor(
-            text=[text],
-            images=image_inputs,
+            text=[r["text"] for r in requests],
+            images=images,
             videos=videos,
             video_metadata=video_metadatas,
+            padding=True,
             return_tensors="pt",
             do_resize=False,
-            **video_kwargs
+            **requests[0]["video_kwargs"]
         )
         
-        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        # Pinned host memory lets the copies run asynchronously.
+        # Tensors already on the GPU (NVDEC-decoded frames) are left where they are.
+        inputs = {
+            k: (v.pin_memory() if pin and not v.is_cuda else v).to(device, non_blocking=pin) if torch.is_tensor(v) else v
+            for k, v in inputs.items()
+        }
         
         # Generate
-        output_ids = self.model.generate(
-            **inputs,
-            max_new_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k,
-            do_sample=temperature > 0,
-        )
+        with torch.inference_mode():
+            output_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                do_sample=temperature > 0,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+            )
         
         # Decode
         generated_ids = [
@@ -284,19 +694,201 @@ class ModelManager:
             for input_ids, output_ids in zip(inputs["input_ids"], output_ids)
         ]
         
-        output_text = self.processor.batch_decode(
+        return self.processor.batch_decode(
             generated_ids,
             skip_special_tokens=True,
             clean_up_tokenization_spaces=True
         )
+    
+    @asynccontextmanager
+    async def _admit_hf(self, messages: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Prepare a request's HF inputs and hold a GPU semaphore slot while the caller generates
+        
+        CPU decodes run before the slot is taken so they overlap other requests' generates.
+        NVDEC decodes put frames straight into VRAM, so they run inside the slot: otherwise
+        every queued request could park a full decoded video on the GPU.
+        """
+        if settings.VIDEO_DECODE_DEVICE == "cpu":
+            prepared = await self._run_blocking(self._prepare_hf_inputs, messages)
+            async with self._gpu_sem:
+                yield prepared
+        else:
+            async with self._gpu_sem:
+                yield await self._run_blocking(self._prepare_hf_inputs, messages)
+    
+    async def _generate_hf(
+        self,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int
+    ) -> str:
+        """Generate using HuggingFace backend"""
+        async with self._admit_hf(messages) as prepared:
+            if self._batch_queue is not None:
+                # Hand off to the micro-batching consumer and wait for our slice of the batch
+                future = asyncio.get_running_loop().create_future()
+                await self._batch_queue.put((prepared, (max_tokens, temperature, top_p, top_k), future))
+                return await future
+            
+            output_text = await self._run_on_gpu(
+                self._generate_hf_batch,
+                [prepared],
+                max_tokens,
+                temperature,
+                top_p,
+                top_k
+            )
         
         return output_text[0] if output_text else ""
     
+    async def _stream_hf(
+        self,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from HF generate as it is decoded (bypasses micro-batching)
+        
+        Generate runs on the GPU thread and pushes text onto this event loop through
+        AsyncTextIteratorStreamer, so no pool thread sits waiting for tokens.
+        """
+        streamer = AsyncTextIteratorStreamer(
+            self.processor.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=True
+        )
+        cancelled = threading.Event()
+        
+        def run():
+            try:
+                self._generate_hf_batch(
+                    [prepared],
+                    max_tokens,
+                    temperature,
+                    top_p,
+                    top_k,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_CancelCriteria(cancelled)])
+                )
+            finally:
+                # Unblock the reader even if generate fails before emitting anything
+                streamer.end()
+        
+        async with self._admit_hf(messages) as prepared:
+            generation = self._run_on_gpu(run)
+            try:
+                async for text in streamer:
+                    if text:
+                        yield text
+            finally:
+                # If the client went away, stop decoding at the next token rather than running
+                # to max_tokens, and hold the admission slot until the GPU is actually free
+                cancelled.set()
+                await generation
+    
+    async def _hf_batch_worker(self):
+        """
+        Coalesce queued HF requests into batched generate calls
+        
+        Waits for one request, then collects up to HF_BATCH_SIZE requests with the
+        same generation parameters within HF_BATCH_WINDOW_MS and runs them as a
+        single forward pass. Requests with other parameters wait for the next batch.
+        """
+        loop = asyncio.get_running_loop()
+        window = settings.HF_BATCH_WINDOW_MS / 1000
+        deferred = deque()
+        # A single get() is kept pending across rounds instead of wrapping each one in
+        # wait_for: before Python 3.12, wait_for can time out after get() has already
+        # dequeued an item, and that request would never be answered (bpo-42130)
+        getter: Optional[asyncio.Task] = None
+        
+        try:
+            while True:
+                if deferred:
+                    first = deferred.popleft()
+                else:
+                    if getter is None:
+                        getter = asyncio.ensure_future(self._batch_queue.get())
+                    first = await getter
+                    getter = None
+                batch = [first]
+                deadline = loop.time() + window
+                
+                # Deferred requests from earlier rounds get the first chance to join
+                for _ in range(len(deferred)):
+                    item = deferred.popleft()
+                    if item[1] == first[1] and len(batch) < settings.HF_BATCH_SIZE:
+                        batch.append(item)
+                    else:
+                        deferred.append(item)
+                
+                while len(batch) < settings.HF_BATCH_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    if getter is None:
+                        getter = asyncio.ensure_future(self._batch_queue.get())
+                    done, _ = await asyncio.wait({getter}, timeout=timeout)
+                    if not done:
+                        break
+                    item = getter.result()
+                    getter = None
+                    if item[1] == first[1]:
+                        batch.append(item)
+                    else:
+                        deferred.append(item)
+                
+                # Drop requests whose callers went away while queued
+                batch = [item for item in batch if not item[2].done()]
+                if not batch:
+                    continue
+                
+                logger.info(f"Running HF batch of {len(batch)} request(s)")
+                try:
+                    output_text = await self._run_on_gpu(
+                        self._generate_hf_batch,
+                        [prepared for prepared, _, _ in batch],
+                        *first[1]
+                    )
+                except Exception as e:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, _, future), text in zip(batch, output_text):
+                    if not future.done():
+                        future.set_result(text)
+        
+        finally:
+            if getter is not None:
+                getter.cancel()
+    
     async def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up model resources...")
+        if self.replicas is not None:
+            await self.replicas.stop()
+            self.replicas = None
+        
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+            self._batch_queue = None
+        
+        if self.backend == "vllm" and self.model is not None:
+            self.model.shutdown()
         self.model = None
         self.processor = None
+        self._executor.shutdown(wait=False)
+        self._gpu_executor.shutdown(wait=False)
         
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -0,0 +1,245 @@
+"""
+Data-parallel model replicas for multi-GPU HF deployments
+Runs one full model copy per GPU in its own process and routes each request
+to the least-loaded replica
+"""
+import os
+import uuid
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _replica_main(rank: int, conn: Connection):
+    """
+    Worker process entry point: pin to one GPU, load a ModelManager and serve requests
+    
+    Messages in are (request_id, mode, kwargs) with mode "generate" or "stream",
+    (request_id, "cancel", None) to abandon a request, or None to shut down.
+    Messages out are (status, request_id, payload) with status "token", "done" or
+    "error". Cancelled requests send nothing further.
+    """
+    # Must happen before app modules are imported: settings are read at import time
+    # and CUDA only honours CUDA_VISIBLE_DEVICES before it initialises
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(rank)
+    os.environ["HF_DATA_PARALLEL"] = "false"
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - replica-{rank} - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    from app.core.model import ModelManager
+    
+    async def handle(manager: ModelManager, request_id: str, mode: str, kwargs: Dict[str, Any]):
+        try:
+            if mode == "stream":
+                async for text in manager.generate_stream(**kwargs):
+                    conn.send(("token", request_id, text))
+                conn.send(("done", request_id, None))
+            else:
+                conn.send(("done", request_id, await manager.generate(**kwargs)))
+        except Exception as e:
+            logger.error(f"Replica {rank} request failed: {e}", exc_info=True)
+            conn.send(("error", request_id, str(e)))
+    
+    async def serve():
+        manager = ModelManager()
+        try:
+            await manager.load_model()
+        except Exception as e:
+            conn.send(("error", None, f"Replica {rank} failed to load model: {e}"))
+            return
+        conn.send(("ready", None, None))
+        
+        loop = asyncio.get_running_loop()
+        tasks: Dict[str, asyncio.Task] = {}
+        while True:
+            message = await loop.run_in_executor(None, conn.recv)
+            if message is None:
+                break
+            request_id, mode, kwargs = message
+            if mode == "cancel":
+                # Closing the stream stops generate at its next token
+                task = tasks.get(request_id)
+                if task is not None:
+                    task.cancel()
+                continue
+            task = asyncio.create_task(handle(manager, request_id, mode, kwargs))
+            tasks[request_id] = task
+            task.add_done_callback(lambda _, request_id=request_id: tasks.pop(request_id, None))
+        
+        await manager.cleanup()
+    
+    asyncio.run(serve())
+
+
+class _Replica:
+    """Parent-side handle for one worker process"""
+    
+    def __init__(self, rank: int, process: mp.Process, conn: Connection):
+        self.rank = rank
+        self.process = process
+        self.conn = conn
+        self.in_flight = 0
+        self.pending: Dict[str, asyncio.Queue] = {}
+
+
+class ReplicaPool:
+    """Manages one model replica process per GPU"""
+    
+    def __init__(self, num_replicas: int):
+        self.num_replicas = num_replicas
+        self._replicas: List[_Replica] = []
+        self._loop = None
+    
+    @property
+    def in_flight(self) -> int:
+        return sum(replica.in_flight for replica in self._replicas)
+    
+    @property
+    def dead_replicas(self) -> List[int]:
+        """Ranks of replica processes that have exited"""
+        return [replica.rank for replica in self._replicas if not replica.process.is_alive()]
+    
+    async def start(self):
+        """Spawn the replica processes and wait until every one has loaded its model"""
+        self._loop = asyncio.get_running_loop()
+        ctx = mp.get_context("spawn")
+        
+        for rank in range(self.num_replicas):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_replica_main, args=(rank, child_conn), daemon=True)
+            process.start()
+            # Drop our copy of the child's end so recv() sees EOF if the replica dies
+            child_conn.close()
+            self._replicas.append(_Replica(rank, process, parent_conn))
+            logger.info(f"Started model replica {rank} (pid {process.pid})")
+        
+        # Replicas load in parallel; wait for each to report in
+        for replica in self._replicas:
+            status, payload = await self._loop.run_in_executor(None, self._wait_ready, replica)
+            if status != "ready":
+                await self.stop()
+                raise RuntimeError(payload)
+            logger.info(f"Model replica {replica.rank} ready")
+        
+        for replica in self._replicas:
+            threading.Thread(
+                target=self._read_results,
+                args=(replica,),
+                name=f"replica-{replica.rank}-reader",
+                daemon=True
+            ).start()
+    
+    @staticmethod
+    def _wait_ready(replica: _Replica) -> Tuple[str, Any]:
+        """Block until a replica reports its load result, or fail if its process exits first"""
+        while not replica.conn.poll(1.0):
+            if not replica.process.is_alive():
+                break
+        try:
+            status, _, payload = replica.conn.recv()
+            return status, payload
+        except (EOFError, OSError):
+            replica.process.join(5)
+            return "error", f"Model replica {replica.rank} exited while loading (exit code {replica.process.exitcode})"
+    
+    def _read_results(self, replica: _Replica):
+        """Forward messages from a replica to the queues of the requests waiting on them"""
+        while True:
+            try:
+                status, request_id, payload = replica.conn.recv()
+            except (EOFError, OSError):
+                break
+            queue = replica.pending.get(request_id)
+            if queue is not None:
+                self._loop.call_soon_threadsafe(queue.put_nowait, (status, payload))
+        
+        # Replica died or was stopped: fail whatever was still waiting on it
+        for queue in list(replica.pending.values()):
+            self._loop.call_soon_threadsafe(
+                queue.put_nowait,
+                ("error", f"Model replica {replica.rank} exited")
+            )
+    
+    def _dispatch(self, mode: str, kwargs: Dict[str, Any]) -> Tuple[_Replica, str, asyncio.Queue]:
+        """Send a request to the least-loaded live replica"""
+        live = [replica for replica in self._replicas if replica.process.is_alive()]
+        if not live:
+            raise RuntimeError("No model replicas are running")
+        
+        replica = min(live, key=lambda r: r.in_flight)
+        request_id = uuid.uuid4().hex
+        queue = asyncio.Queue()
+        replica.pending[request_id] = queue
+        try:
+            replica.conn.send((request_id, mode, kwargs))
+            replica.in_flight += 1
+        except (BrokenPipeError, OSError) as e:
+            replica.pending.pop(request_id, None)
+            raise RuntimeError(f"Model replica {replica.rank} is not accepting requests: {e}")
+        return replica, request_id, queue
+    
+    def _release(self, replica: _Replica, request_id: str, finished: bool):
+        """Forget a request, telling the replica to stop working on it if it never finished"""
+        replica.pending.pop(request_id, None)
+        replica.in_flight -= 1
+        if not finished:
+            try:
+                replica.conn.send((request_id, "cancel", None))
+            except (BrokenPipeError, OSError):
+                pass
+    
+    async def generate(self, **kwargs) -> str:
+        """Run ModelManager.generate on a replica"""
+        replica, request_id, queue = self._dispatch("generate", kwargs)
+        finished = False
+        try:
+            status, payload = await queue.get()
+            finished = True
+            if status == "error":
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            self._release(replica, request_id, finished)
+    
+    async def generate_stream(self, **kwargs) -> AsyncIterator[str]:
+        """Run ModelManager.generate_stream on a replica, yielding its text deltas"""
+        replica, request_id, queue = self._dispatch("stream", kwargs)
+        finished = False
+        try:
+            while True:
+                status, payload = await queue.get()
+                if status == "token":
+                    yield payload
+                    continue
+                finished = True
+                if status == "done":
+                    return
+                raise RuntimeError(payload)
+        finally:
+            # An abandoned stream would otherwise keep its replica generating to max_tokens
+            self._release(replica, request_id, finished)
+    
+    async def stop(self):
+        """Ask every replica to shut down, terminating any that don't exit in time"""
+        for replica in self._replicas:
+            try:
+                replica.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        
+        for replica in self._replicas:
+            await self._loop.run_in_executor(None, replica.process.join, 30)
+            if replica.process.is_alive():
+                logger.warning(f"Model replica {replica.rank} did not exit, terminating")
+                replica.process.terminate()
+            replica.conn.close()
+        
+        self._replicas = []
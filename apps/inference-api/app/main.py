@@ -2,15 +2,20 @@
 TRU V2 MVP - VLM Inference API
 FastAPI service for video + prompt processing using Qwen3-VL
 """
+import gc
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
+import torch
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.api.routes import inference, health
 from app.core.config import settings
 from app.core.model import ModelManager
+from app.core.video import close_session
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +24,34 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def _vram_watchdog(model_manager: ModelManager):
+    """
+    Periodically return cached-but-unused VRAM to the driver
+    
+    The CUDA caching allocator never shrinks on its own, so reserved memory can
+    grow far past what live tensors use. Only runs between requests, never while
+    an inference is in flight. The footprint left by the startup warmup is
+    treated as the floor: the cache is emptied only when idle reserved memory
+    exceeds both live tensors and that warm footprint by EMPTY_CACHE_THRESHOLD_GB,
+    so warmed segments aren't handed back on the first idle tick.
+    """
+    threshold_bytes = settings.EMPTY_CACHE_THRESHOLD_GB * 1e9
+    
+    while True:
+        await asyncio.sleep(settings.VRAM_WATCHDOG_INTERVAL_S)
+        if model_manager.in_flight > 0:
+            continue
+        
+        for i in range(torch.cuda.device_count()):
+            floor = max(torch.cuda.memory_allocated(i), model_manager.warm_reserved.get(i, 0))
+            idle_bytes = torch.cuda.memory_reserved(i) - floor
+            if idle_bytes > threshold_bytes:
+                logger.info(f"Cached VRAM on GPU {i} is {idle_bytes / 1e9:.2f}GB past its floor, emptying the cache")
+                gc.collect()
+                torch.cuda.empty_cache()
+                break
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager - handles startup and shutdown"""
@@ -35,10 +68,18 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to load model: {e}")
         raise
     
+    watchdog = None
+    # Replica processes own the GPUs in data-parallel mode; the parent holds no CUDA memory
+    if torch.cuda.is_available() and settings.VRAM_WATCHDOG_INTERVAL_S > 0 and model_manager.replicas is None:
+        watchdog = asyncio.create_task(_vram_watchdog(model_manager))
+    
     yield
     
     # Shutdown: Cleanup
     logger.info("Shutting down TRU V2 inference service...")
+    if watchdog is not None:
+        watchdog.cancel()
+    await close_session()
     if hasattr(app.state, 'model_manager'):
         await app.state.model_manager.cleanup()
 
@@ -48,6 +89,7 @@ app = FastAPI(
     description="Video Language Model inference service using Qwen3-VL",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware
@@ -346,15 +346,17 @@ def _read_video_torchcodec(
             - video: the path of video. support "file://", "http://", "https://" and local path.
             - video_start: the start time of video.
             - video_end: the end time of video.
+            - decode_device: "cpu" (default) or a CUDA device to decode with NVDEC.
     Returns:
-        torch.Tensor: the video tensor with shape (T, C, H, W).
+        torch.Tensor: the video tensor with shape (T, C, H, W), on `decode_device`.
     """
     from torchcodec.decoders import VideoDecoder
     TORCHCODEC_NUM_THREADS = int(os.environ.get('TORCHCODEC_NUM_THREADS', 8))
     logger.info(f"set TORCHCODEC_NUM_THREADS: {TORCHCODEC_NUM_THREADS}")
     video_path = ele["video"]
+    decode_device = ele.get("decode_device", "cpu")
     st = time.time()
-    decoder = VideoDecoder(video_path, num_ffmpeg_threads=TORCHCODEC_NUM_THREADS)
+    decoder = VideoDecoder(video_path, num_ffmpeg_threads=TORCHCODEC_NUM_THREADS, device=decode_device)
     video_fps = decoder.metadata.average_fps
     total_frames = decoder.metadata.num_frames
     start_frame, end_frame, total_frames = calculate_video_frame_range(
@@ -366,7 +368,7 @@ def _read_video_torchcodec(
     idx = torch.linspace(start_frame, end_frame, nframes).round().long().tolist()
     sample_fps = nframes / max(total_frames, 1e-6) * video_fps
     video = decoder.get_frames_at(indices=idx).data
-    logger.info(f"torchcodec:  {video_path=}, {total_frames=}, {video_fps=}, time={time.time() - st:.3f}s")
+    logger.info(f"torchcodec:  {video_path=}, {decode_device=}, {total_frames=}, {video_fps=}, time={time.time() - st:.3f}s")
 
     video_metadata = dict(
         fps=video_fps,